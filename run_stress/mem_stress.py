@@ -3,8 +3,243 @@
 import numpy as np
 import time
 import argparse
+import glob
+import json
+import os
+import select
+import sys
+import threading
 import multiprocessing as mp
 
+CACHE_LINE = 64     # octets
+PAGE_SIZE = 4096    # octets (pages 4 KiB, pas de huge pages)
+ELEM = 8            # float64
+
+# -------------------------------------------------------------------
+# 0. ARRAY CACHE (persistent worker mode)
+# -------------------------------------------------------------------
+# None = allocation fraîche à chaque test (mode CLI classique).
+# En mode worker, dict {(role, size, fill): array} : les tableaux restent
+# alloués et remplis entre deux jobs compatibles. Le cache est un LRU limité
+# à _CACHE_MAX_ARRAYS tableaux, le maximum qu'utilise un seul test (src + dst),
+# pour ne pas dépasser l'empreinte mémoire d'un process de la version CLI.
+_ARRAY_CACHE = None
+_CACHE_MAX_ARRAYS = 2
+
+
+def _alloc(role, size, fill="rand"):
+    # fill : "rand" (np.random.rand), "ones" ou "empty"
+    if _ARRAY_CACHE is not None:
+        key = (role, size, fill)
+        arr = _ARRAY_CACHE.pop(key, None)
+        if arr is not None:
+            _ARRAY_CACHE[key] = arr   # remis en fin de LRU
+            return arr
+        # nouvelle taille : on libère les tableaux des autres tailles
+        for k in [k for k in _ARRAY_CACHE if k[1] != size]:
+            del _ARRAY_CACHE[k]
+        # libère avant d'allouer pour rester sous la limite
+        while len(_ARRAY_CACHE) >= _CACHE_MAX_ARRAYS:
+            del _ARRAY_CACHE[next(iter(_ARRAY_CACHE))]
+    if fill == "ones":
+        arr = np.ones(size)
+    elif fill == "empty":
+        arr = np.empty(size)
+    else:
+        arr = np.random.rand(size)
+    if _ARRAY_CACHE is not None:
+        _ARRAY_CACHE[(role, size, fill)] = arr
+    return arr
+
+# -------------------------------------------------------------------
+# 0b. ENERGY / FREQUENCY (RAPL powercap + cpufreq sysfs)
+# -------------------------------------------------------------------
+# None = pas de mesure d'énergie. Sinon racine sysfs ("/sys" ou un faux
+# arbre pour les tests) lue autour de la zone chronométrée de chaque noyau.
+_ENERGY_ROOT = None
+FREQ_INTERVAL_S = 0.1   # période d'échantillonnage de cpufreq pendant le run
+_meter = None           # mesure en cours (dict), posée par _meter_start
+_LAST_ENERGY = None     # résultat de la dernière mesure (dict)
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _rapl_zones(root):
+    # {chemin zone: (type, max_energy_range_uj)} ; type "pkg" ou "dram"
+    zones = {}
+    for zone in sorted(glob.glob(os.path.join(root, "class", "powercap", "intel-rapl:*"))):
+        try:
+            with open(os.path.join(zone, "name")) as f:
+                name = f.read().strip()
+        except OSError:
+            continue
+        if name.startswith("package"):
+            kind = "pkg"
+        elif name == "dram":
+            kind = "dram"
+        else:
+            continue   # core, uncore, psys : déjà inclus dans package ou hors périmètre
+        zones[zone] = (kind, _read_int(os.path.join(zone, "max_energy_range_uj")))
+    return zones
+
+
+def _current_cpu():
+    # CPU où tourne le thread principal (celui du noyau) : champ 39 de
+    # /proc/self/stat, compté après le nom du process entre parenthèses
+    try:
+        with open("/proc/self/stat") as f:
+            return int(f.read().rsplit(")", 1)[1].split()[36])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _sample_freq(meter):
+    # Fréquence (kHz) du CPU qui exécute le benchmark à cet instant
+    cpu = _current_cpu()
+    if cpu is None:
+        return
+    khz = _read_int(os.path.join(meter["root"], "devices", "system", "cpu", f"cpu{cpu}",
+                                 "cpufreq", "scaling_cur_freq"))
+    if khz is not None:
+        meter["freqs"].append(khz)
+
+
+def _freq_sampler(meter):
+    while not meter["stop"].wait(FREQ_INTERVAL_S):
+        _sample_freq(meter)
+
+
+# -------------------------------------------------------------------
+# 0c. PERF CONTROL (perf stat --control, piloté par le worker)
+# -------------------------------------------------------------------
+# (ctl_fd, ack_fd) des fifos de contrôle de perf pendant un job, sinon None.
+# Le worker active les compteurs juste avant la zone chronométrée et les
+# coupe juste après : allocation et remplissage des tableaux ne sont jamais
+# comptés, que le cache de tableaux soit chaud ou non.
+_PERF_CTL = None
+PERF_ACK_TIMEOUT_S = 5.0
+_perf_ok = True         # False si perf n'a pas acquitté une commande du job
+_perf_enabled = False   # compteurs actifs (enable envoyé sans disable)
+
+
+def _perf_command(command):
+    global _perf_ok, _perf_enabled
+    if _PERF_CTL is None:
+        return
+    _perf_enabled = command == "enable"
+    ctl_fd, ack_fd = _PERF_CTL
+    os.write(ctl_fd, (command + "\n").encode())
+    ready, _, _ = select.select([ack_fd], [], [], PERF_ACK_TIMEOUT_S)
+    if not ready or b"ack" not in os.read(ack_fd, 64):
+        _perf_ok = False
+
+
+def _perf_open(ctl_path, ack_path):
+    # Les fifos sont déjà ouvertes côté script : pas de blocage à l'ouverture
+    global _PERF_CTL, _perf_ok, _perf_enabled
+    _PERF_CTL = (os.open(ctl_path, os.O_WRONLY | os.O_NONBLOCK),
+                 os.open(ack_path, os.O_RDONLY | os.O_NONBLOCK))
+    _perf_ok = True
+    _perf_enabled = False
+
+
+def _perf_close():
+    global _PERF_CTL
+    if _PERF_CTL is not None:
+        for fd in _PERF_CTL:
+            os.close(fd)
+    _PERF_CTL = None
+
+
+def _meter_abort():
+    # Noyau interrompu entre _meter_start et _meter_stop : arrête
+    # l'échantillonneur (sinon le thread fuit) et coupe les compteurs perf
+    global _meter
+    meter, _meter = _meter, None
+    if meter is not None:
+        meter["stop"].set()
+        meter["thread"].join()
+    if _perf_enabled:
+        _perf_command("disable")
+
+
+def _meter_start():
+    # Relevé RAPL + échantillonneur de fréquence (si activé), puis activation
+    # des compteurs perf (si le job est piloté par perf --control)
+    global _meter
+    _meter_abort()   # mesure précédente jamais fermée
+    if _ENERGY_ROOT is None:
+        _meter = None
+        _perf_command("enable")
+        return
+    root = _ENERGY_ROOT
+    zones = _rapl_zones(root)
+    _meter = {
+        "root": root,
+        "zones": zones,
+        "energy_uj": {z: _read_int(os.path.join(z, "energy_uj")) for z in zones},
+        "freqs": [],
+        "stop": threading.Event(),
+    }
+    _sample_freq(_meter)
+    _meter["thread"] = threading.Thread(target=_freq_sampler, args=(_meter,), daemon=True)
+    _meter["thread"].start()
+    _perf_command("enable")
+
+
+def _meter_stop(bytes_moved=None, accesses=None):
+    """
+    Closes the measurement opened by _meter_start (perf counters first).
+
+    Stores in _LAST_ENERGY the package and DRAM energy in joules, joules per GB
+    moved (package + DRAM), joules per access and the average CPU frequency.
+    Values that cannot be read (no RAPL, no permission, no cpufreq) are None.
+
+    Args:
+        bytes_moved (int): Bytes moved in the timed region, counted in whole
+            cache lines for every kernel so J/GB is comparable across modes
+            (None to skip J/GB).
+        accesses (int): Accesses made in the timed region (None to skip J/access).
+    """
+    global _meter, _LAST_ENERGY
+    _perf_command("disable")
+    meter, _meter = _meter, None
+    if meter is None:
+        _LAST_ENERGY = None
+        return
+    energy = {"pkg": None, "dram": None}
+    for zone, (kind, max_range) in meter["zones"].items():
+        before = meter["energy_uj"][zone]
+        after = _read_int(os.path.join(zone, "energy_uj"))
+        if before is None or after is None:
+            continue
+        delta = after - before
+        if delta < 0:   # le compteur a rebouclé
+            if not max_range:
+                continue   # plage inconnue : énergie de la zone inconnue
+            delta += max_range
+        energy[kind] = (energy[kind] or 0) + delta / 1e6
+    meter["stop"].set()
+    meter["thread"].join()
+    _sample_freq(meter)
+    freqs = meter["freqs"]
+
+    known = [e for e in energy.values() if e is not None]
+    total_j = sum(known) if known else None
+    _LAST_ENERGY = {
+        "energy_pkg_j": energy["pkg"],
+        "energy_dram_j": energy["dram"],
+        "j_per_gb": total_j / (bytes_moved / 1024**3) if total_j is not None and bytes_moved else None,
+        "j_per_access": total_j / accesses if total_j is not None and accesses else None,
+        "avg_freq_mhz": sum(freqs) / len(freqs) / 1000 if freqs else None,
+    }
+
 # -------------------------------------------------------------------
 # 1. MEMORY COPY TEST (High-Speed Sequential)
 # -------------------------------------------------------------------
@@ -25,9 +260,10 @@ def copy_test(size_mb, iterations):
             total_time_s (float): Total duration of the test in seconds.
     """
     size = size_mb * 1024 * 1024 // 8  # éléments float64 (8 bytes)
-    src = np.random.rand(size)
-    dst = np.empty_like(src)
+    src = _alloc("src", size)
+    dst = _alloc("dst", size, "empty")
     latencies = []
+    _meter_start()
     t_start = time.perf_counter()
     for _ in range(iterations):
         t0 = time.perf_counter_ns()
@@ -36,6 +272,7 @@ def copy_test(size_mb, iterations):
         latencies.append((t1 - t0)/len(src))
     t_end = time.perf_counter()
     bytes_copied = size_mb * 1024 * 1024 * iterations
+    _meter_stop(bytes_moved=bytes_copied)
     gb_s = bytes_copied / (t_end - t_start) / (1024**3)
     avg_latency_ns = sum(latencies)/len(latencies)
     return gb_s, t_end - t_start , avg_latency_ns, latencies
@@ -61,9 +298,10 @@ def sequential_read(size_mb, iterations):
     """
     size = size_mb * 1024 * 1024 // 8  # éléments float64 (8 bytes)
     #src = np.random.rand(size)
-    src = np.ones(size)
+    src = _alloc("arr", size, "ones")
     
     latencies = []
+    _meter_start()
     t_start = time.perf_counter()
     for _ in range(iterations):
         t0 = time.perf_counter_ns()
@@ -72,6 +310,7 @@ def sequential_read(size_mb, iterations):
         latencies.append((t1 - t0)/len(src))
     t_end = time.perf_counter()
     bytes_processed = size_mb * 1024 * 1024 * iterations
+    _meter_stop(bytes_moved=bytes_processed)
     gb_s = bytes_processed / (t_end - t_start) / (1024**3)
     avg_latency_ns = sum(latencies)/len(latencies)
     return gb_s, t_end - t_start , avg_latency_ns, latencies
@@ -88,10 +327,11 @@ def sequential_write(size_mb, iterations):
     maximum write bandwidth and Write Combining buffer efficiency.
     """
     size = size_mb * 1024 * 1024 // 8  # float64
-    arr = np.ones(size)  
+    arr = _alloc("arr", size, "ones")
     val = 1.0           
     
     latencies = []
+    _meter_start()
     t_start = time.perf_counter()
     
     for _ in range(iterations):
@@ -106,6 +346,7 @@ def sequential_write(size_mb, iterations):
     
     # Calcul du débit
     bytes_processed = size_mb * 1024 * 1024 * iterations
+    _meter_stop(bytes_moved=bytes_processed)
     gb_s = bytes_processed / (t_end - t_start) / (1024**3)
     avg_latency_ns = sum(latencies)/len(latencies)
     
@@ -134,7 +375,8 @@ def random_access_test(size_mb, duration_s, batch=50000):
 
     """
     size = size_mb * 1024 * 1024 // 8
-    arr = np.random.rand(size)
+    arr = _alloc("arr", size)
+    _meter_start()
     start = time.time()
     ops = 0
     latencies = []
@@ -146,6 +388,8 @@ def random_access_test(size_mb, duration_s, batch=50000):
         t1 = time.perf_counter_ns()
         ops += batch
         latencies.append((t1 - t0) / batch)
+    # chaque accès aléatoire ramène une ligne de cache entière
+    _meter_stop(bytes_moved=ops * CACHE_LINE, accesses=ops)
 
     avg_latency_ns = sum(latencies) / len(latencies)
     return ops / duration_s, avg_latency_ns, latencies
@@ -169,7 +413,8 @@ def random_write_test(size_mb, duration_s, batch=50000):
         float: Number of random write operations per second (ops/s).
     """
     size = size_mb * 1024 * 1024 // 8
-    arr = np.random.rand(size)
+    arr = _alloc("arr", size)
+    _meter_start()
     start = time.time()
     ops = 0
     latencies = []
@@ -181,6 +426,8 @@ def random_write_test(size_mb, duration_s, batch=50000):
         t1 = time.perf_counter_ns()
         ops += batch
         latencies.append((t1 - t0) / batch)
+    # chaque accès aléatoire ramène une ligne de cache entière
+    _meter_stop(bytes_moved=ops * CACHE_LINE, accesses=ops)
 
     avg_latency_ns = sum(latencies) / len(latencies)
     return ops / duration_s , avg_latency_ns, latencies
@@ -197,16 +444,194 @@ def stride_test(size_mb, duration_s, stride_bytes=4096):
     if stride_idx < 1: stride_idx = 1
     
     size = size_mb * 1024 * 1024 // 8
-    arr = np.random.rand(size)
+    arr = _alloc("arr", size)
     
+    _meter_start()
     start = time.time()
     ops = 0
     while time.time() - start < duration_s:
         # Lecture linéaire avec sauts
         _ = arr[::stride_idx].sum() 
         ops += (size // stride_idx)
+    # octets déplacés = lignes de cache touchées par passe (cf. _units_touched)
+    per_pass = size // stride_idx
+    passes = ops // per_pass if per_pass else 0
+    moved = passes * _units_touched(per_pass, stride_idx * 8, CACHE_LINE) * CACHE_LINE
+    _meter_stop(bytes_moved=moved, accesses=ops)
     return ops / duration_s
 
+# -------------------------------------------------------------------
+# 4b. PATTERN GENERATOR (strides, streams, 2-D, tiles)
+# -------------------------------------------------------------------
+ACCESS_PATTERNS = ["stride_fwd", "stride_bwd", "multi_stream",
+                   "row_major", "col_major", "tiled"]
+
+
+def _units_touched(n, stride_bytes, unit):
+    # Nombre d'unités (lignes de cache / pages) distinctes touchées par
+    # n éléments espacés de stride_bytes (tableau supposé aligné sur unit)
+    if n <= 0:
+        return 0
+    if stride_bytes >= unit:
+        return n
+    return ((n - 1) * stride_bytes + ELEM + unit - 1) // unit
+
+
+def _pattern_plan(pattern, size, stride_bytes, streams, row_bytes, tile_bytes):
+    # Construit le noyau à chronométrer et sa comptabilité par itération :
+    # (kernel, useful_bytes, lines, dst_lines, pages). lines = lignes de cache
+    # lues dans la source, comptées par passe (colonne, tuile, bloc...) sans
+    # réutilisation entre passes ; dst_lines = lignes écrites dans le tampon
+    # de destination (0 pour les motifs en lecture seule). Les pages sont les
+    # pages distinctes touchées dans la source (empreinte TLB).
+    if pattern in ("stride_fwd", "stride_bwd"):
+        stride_idx = max(1, stride_bytes // ELEM)
+        arr = _alloc("arr", size)
+        view = arr[::stride_idx] if pattern == "stride_fwd" else arr[::-stride_idx]
+        n = len(view)
+        step = stride_idx * ELEM
+
+        def kernel():
+            return view.sum()
+        return (kernel, n * ELEM,
+                _units_touched(n, step, CACHE_LINE), 0,
+                _units_touched(n, step, PAGE_SIZE))
+
+    # Les autres motifs sont des copies vers un tampon contigu : la copie suit
+    # l'ordre (C) de la destination, donc une vue réordonnée de la source donne
+    # le parcours voulu en un seul appel NumPy. L'écriture contiguë de la
+    # destination est comptée à part (dst_lines).
+    if pattern == "multi_stream":
+        # k flux séquentiels entrelacés : le tableau est coupé en k morceaux
+        # contigus lus en parallèle, un bloc de row_bytes par flux à chaque pas
+        k = max(1, streams)
+        blk = max(1, min(row_bytes // ELEM, size // k))
+        n_blocks = size // k // blk
+        m = n_blocks * blk
+        src = _alloc("arr", size)[:k * m].reshape(k, n_blocks, blk).transpose(1, 0, 2)
+        dst = _alloc("dst", size, "empty")[:k * m].reshape(n_blocks, k, blk)
+
+        def kernel():
+            np.copyto(dst, src)
+        lines = k * n_blocks * _units_touched(blk, ELEM, CACHE_LINE)
+        pages = _units_touched(k * m, ELEM, PAGE_SIZE)   # les k morceaux sont contigus
+        return kernel, k * m * ELEM, lines, _units_touched(k * m, ELEM, CACHE_LINE), pages
+
+    # Motifs 2-D : tableau de rows x cols, une ligne fait row_bytes octets
+    cols = max(1, row_bytes // ELEM)
+    rows = max(1, size // cols)
+    if pattern == "tiled":
+        # tuiles carrées de tile_bytes de large (tile x tile éléments)
+        tile = max(1, min(tile_bytes // ELEM, cols, rows))
+        if cols % tile:
+            # tile peut avoir été réduit à rows : on donne la taille réellement utilisée
+            raise ValueError(f"tile of {tile} elements ({tile * ELEM} B) does not divide "
+                             f"a row of {cols} elements ({cols * ELEM} B)")
+        rows = rows // tile * tile
+    arr2d = _alloc("arr", size)[:rows * cols].reshape(rows, cols)
+    buf = _alloc("dst", size, "empty")[:rows * cols]
+    useful = rows * cols * ELEM
+    row_span = cols * ELEM
+    pages = _units_touched(rows * cols, ELEM, PAGE_SIZE)
+    dst_lines = _units_touched(rows * cols, ELEM, CACHE_LINE)
+
+    if pattern == "row_major":
+        dst = buf.reshape(rows, cols)
+
+        def kernel():
+            np.copyto(dst, arr2d)
+        lines = rows * _units_touched(cols, ELEM, CACHE_LINE)
+        return kernel, useful, lines, dst_lines, pages
+
+    if pattern == "col_major":
+        # destination transposée : la source est lue colonne par colonne
+        dst = buf.reshape(cols, rows)
+
+        def kernel():
+            np.copyto(dst, arr2d.T)
+        lines = cols * _units_touched(rows, row_span, CACHE_LINE)
+        return kernel, useful, lines, dst_lines, pages
+
+    if pattern == "tiled":
+        # vue 4-D (tuile i, tuile j, ligne, colonne) : tuile par tuile
+        n_ti = rows // tile
+        n_tj = cols // tile
+        src = arr2d.reshape(n_ti, tile, n_tj, tile).transpose(0, 2, 1, 3)
+        dst = buf.reshape(n_ti, n_tj, tile, tile)
+
+        def kernel():
+            np.copyto(dst, src)
+        lines = n_ti * n_tj * tile * _units_touched(tile, ELEM, CACHE_LINE)
+        return kernel, useful, lines, dst_lines, pages
+
+    raise ValueError(f"unknown pattern: {pattern}")
+
+
+def pattern_test(size_mb, iterations, pattern="stride_fwd", stride_bytes=4096,
+                 streams=4, row_bytes=4096, tile_bytes=512):
+    """
+    Runs a generalized access pattern and reports useful vs moved bytes.
+
+    Covers forward/backward strides (one strided sum), and, as a single
+    copy into a contiguous buffer read in the chosen order, k interleaved
+    sequential streams, row- versus column-major 2-D traversal and blocked
+    (tiled) traversal.
+    Useful bytes are the source bytes read. Source cache lines are counted
+    per pass with no reuse between passes; for the copy patterns each
+    destination line costs a read-for-ownership plus a write-back, so moved
+    bytes = (cache_lines + 2 * dst_lines) * 64. modeled_moved_gb_s is a
+    model, not a measurement: what the memory system would move if nothing
+    stayed cached. Compare it with the perf LLC misses to see how much the
+    caches actually absorbed. Pages are the distinct source pages touched by
+    one traversal.
+
+    Args:
+        size_mb (int): Size of the working array in MiB.
+        iterations (int): Number of full traversals.
+        pattern (str): One of ACCESS_PATTERNS.
+        stride_bytes (int): Stride for stride_fwd / stride_bwd.
+        streams (int): Number of interleaved streams for multi_stream.
+        row_bytes (int): Row length of the 2-D array (row/col/tiled), or
+            block read per stream at each step (multi_stream).
+        tile_bytes (int): Tile width for tiled.
+
+    Returns:
+        dict: pattern, useful_bytes, cache_lines, dst_lines, pages,
+            effective_gb_s, modeled_moved_gb_s, total_time_s, avg_latency_ns,
+            latencies (useful_bytes, cache_lines, dst_lines and pages are per
+            iteration).
+    """
+    size = size_mb * 1024 * 1024 // ELEM
+    kernel, useful, lines, dst_lines, pages = _pattern_plan(
+        pattern, size, stride_bytes, streams, row_bytes, tile_bytes)
+    n_elems = max(1, useful // ELEM)
+    moved = (lines + 2 * dst_lines) * CACHE_LINE   # RFO + write-back par ligne écrite
+
+    latencies = []
+    _meter_start()
+    t_start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        _ = kernel()
+        t1 = time.perf_counter_ns()
+        latencies.append((t1 - t0) / n_elems)
+    t_end = time.perf_counter()
+    _meter_stop(bytes_moved=moved * iterations)
+
+    elapsed = t_end - t_start
+    return {
+        "pattern": pattern,
+        "useful_bytes": useful,
+        "cache_lines": lines,
+        "dst_lines": dst_lines,
+        "pages": pages,
+        "effective_gb_s": useful * iterations / elapsed / (1024**3),
+        "modeled_moved_gb_s": moved * iterations / elapsed / (1024**3),
+        "total_time_s": elapsed,
+        "avg_latency_ns": sum(latencies) / len(latencies),
+        "latencies": latencies,
+    }
+
 # -------------------------------------------------------------------
 # 5. Worker for Parallel Mode (rand_multi)
 # -------------------------------------------------------------------
@@ -235,13 +660,117 @@ def stride_test(size_mb, duration_s, stride_bytes=4096):
     #"""
     #return copy_test(args.size_mb, args.iters)
 
+# -------------------------------------------------------------------
+# 6. PERSISTENT WORKER (JSON jobs over stdin/stdout)
+# -------------------------------------------------------------------
+JOB_DEFAULTS = {"size_mb": 1024, "iters": 10, "duration": 10, "batch": 50000,
+                "stride_bytes": 4096, "pattern": "stride_fwd", "streams": 4,
+                "row_bytes": 4096, "tile_bytes": 512, "energy": False, "sysfs_root": "/sys"}
+
+
+def run_job(job):
+    """
+    Runs one benchmark described by a dict and returns structured results.
+
+    Missing keys take their value from JOB_DEFAULTS (same defaults as the CLI).
+
+    Args:
+        job (dict): Job description; "mode" is one of the CLI modes.
+
+    Returns:
+        dict: mode, ops_or_bw (GB/s or ops/s), lat_ns, plus the pattern
+            accounting fields for mode "pattern" and the energy fields
+            (see _meter_stop) when job["energy"] is true. Per-iteration
+            latencies are included only when job["latencies"] is true.
+            With job["perf_ctl"] / job["perf_ack"] (perf stat --control
+            fifos), perf counts only the timed region and perf_counted
+            tells whether every enable/disable was acknowledged.
+    """
+    global _ENERGY_ROOT
+    j = dict(JOB_DEFAULTS, **job)
+    _ENERGY_ROOT = j["sysfs_root"] if j["energy"] else None
+    if j.get("perf_ctl"):
+        _perf_open(j["perf_ctl"], j["perf_ack"])
+    try:
+        result = _run_kernel(j)
+    finally:
+        _meter_abort()   # no-op si le noyau a fermé sa mesure
+        perf_counted = _PERF_CTL is not None and _perf_ok
+        _perf_close()
+    if j.get("perf_ctl"):
+        result["perf_counted"] = perf_counted
+    return result
+
+
+def _run_kernel(j):
+    mode = j["mode"]
+    size_mb = j["size_mb"]
+    latencies = None
+    extra = {}
+
+    if mode == "copy":
+        ops, _, lat, latencies = copy_test(size_mb, j["iters"])
+    elif mode == "sequential_read":
+        ops, _, lat, latencies = sequential_read(size_mb, j["iters"])
+    elif mode == "sequential_write":
+        ops, _, lat, latencies = sequential_write(size_mb, j["iters"])
+    elif mode == "random_read":
+        ops, lat, latencies = random_access_test(size_mb, j["duration"], j["batch"])
+    elif mode == "random_write":
+        ops, lat, latencies = random_write_test(size_mb, j["duration"], j["batch"])
+    elif mode == "stride":
+        ops, lat = stride_test(size_mb, j["duration"], j["stride_bytes"]), None
+    elif mode == "pattern":
+        r = pattern_test(size_mb, j["iters"], j["pattern"], j["stride_bytes"],
+                         j["streams"], j["row_bytes"], j["tile_bytes"])
+        ops, lat, latencies = r["effective_gb_s"], r["avg_latency_ns"], r["latencies"]
+        extra = {k: r[k] for k in ("pattern", "useful_bytes", "cache_lines", "dst_lines", "pages",
+                                  "modeled_moved_gb_s")}
+    else:
+        raise ValueError(f"unknown mode: {mode}")
+
+    result = {"mode": mode, "ops_or_bw": ops, "lat_ns": lat}
+    result.update(extra)
+    if _LAST_ENERGY is not None:
+        result.update(_LAST_ENERGY)
+    if j.get("latencies"):
+        result["latencies"] = latencies
+    return result
+
+
+def worker_loop(inp=sys.stdin, out=sys.stdout):
+    """
+    Long-lived worker: reads one JSON job per line, writes one JSON reply per line.
+
+    NumPy is imported once and arrays stay allocated between jobs of the same
+    size. Prints {"ready": true} first, then {"ok": true, "result": {...}} or
+    {"ok": false, "error": "..."} per job. Stops on EOF or {"mode": "quit"}.
+    """
+    global _ARRAY_CACHE
+    _ARRAY_CACHE = {}
+    out.write(json.dumps({"ready": True}) + "\n")
+    out.flush()
+    for line in inp:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+            if job.get("mode") == "quit":
+                break
+            reply = {"ok": True, "result": run_job(job)}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        out.write(json.dumps(reply) + "\n")
+        out.flush()
+
 # -------------------------------------------------------------------
 # MAIN
 # -------------------------------------------------------------------
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode",
-                        choices=["copy", "sequential_read", "sequential_write", "random_read", "random_write", "stride"],
+                        choices=["copy", "sequential_read", "sequential_write", "random_read", "random_write", "stride", "pattern", "worker"],
                         default="copy")
     parser.add_argument("--size-mb", type=int, default=1024)
     parser.add_argument("--iters", type=int, default=10)
@@ -249,7 +778,20 @@ if __name__ == "__main__":
     parser.add_argument("--procs", type=int, default=1)
     parser.add_argument("--batch", type=int, default=50000)
     parser.add_argument("--stride-bytes", type=int, default=4096)
+    parser.add_argument("--pattern", choices=ACCESS_PATTERNS, default="stride_fwd")
+    parser.add_argument("--streams", type=int, default=4)
+    parser.add_argument("--row-bytes", type=int, default=4096)
+    parser.add_argument("--tile-bytes", type=int, default=512)
+    parser.add_argument("--energy", action="store_true")
+    parser.add_argument("--sysfs-root", default="/sys")
     args = parser.parse_args()
+    if args.energy:
+        _ENERGY_ROOT = args.sysfs_root
+
+    # WORKER PERSISTANT (jobs JSON sur stdin)
+    if args.mode == "worker":
+        worker_loop()
+        sys.exit(0)
 
     # MULTIPROCESSING
     #if args.mode == "rand_multi":
@@ -288,4 +830,16 @@ if __name__ == "__main__":
     # AJOUT DU BLOC STRIDE
     elif args.mode == "stride":
         ops_s = stride_test(args.size_mb, args.duration, args.stride_bytes)
-        print(f"Stride ops/s: {ops_s:.0f}")
\ No newline at end of file
+        print(f"Stride ops/s: {ops_s:.0f}")
+
+    elif args.mode == "pattern":
+        r = pattern_test(args.size_mb, args.iters, args.pattern, args.stride_bytes,
+                         args.streams, args.row_bytes, args.tile_bytes)
+        print(f"Pattern {r['pattern']} {args.size_mb} MiB x {args.iters} => {r['effective_gb_s']:.2f} GB/s "
+              f"(modeled moved {r['modeled_moved_gb_s']:.2f} GB/s), useful: {r['useful_bytes']} B, "
+              f"lines: {r['cache_lines']}, dst lines: {r['dst_lines']}, pages: {r['pages']}, latence: {r['avg_latency_ns']:.1f} ns")
+
+    # MESURE ENERGIE (--energy)
+    if _LAST_ENERGY is not None:
+        print("Energy " + ", ".join(f"{k}: {v:.4g}" if v is not None else f"{k}: n/a"
+                                    for k, v in _LAST_ENERGY.items()))
@@ -2,6 +2,12 @@
 import subprocess
 import pandas as pd
 import os
+import json
+import select
+import shutil
+import signal
+import tempfile
+import time
 
 # ------------------ CONFIG ------------------
 patterns = ["copy","sequential_read","sequential_write", "random_read", "random_write"]
@@ -12,6 +18,18 @@ batch = 50000
 # Phase 2 : Test Stride (TLB)
 stride_list = [64, 256, 512, 1024, 2048, 4096, 8192]
 fixed_size_for_stride = 512 
+# Phase 3 : Générateur de motifs (prefetchers / tiling)
+access_patterns = ["stride_fwd", "stride_bwd", "multi_stream", "row_major", "col_major", "tiled"]
+pattern_strides = [64, 4096]
+fixed_size_for_pattern = 512
+perf_events = "cycles,instructions,L1-dcache-load-misses,LLC-load-misses,dTLB-load-misses"
+perf_ack_timeout = 5.0  # secondes max pour que perf confirme enable/disable
+# Energie / fréquence (RAPL + cpufreq), lues dans sysfs_root
+measure_energy = True
+sysfs_root = "/sys"
+# CPU sur lequel épingler le worker (None = pas d'épinglage, comme la version
+# un-process-par-point ; la fréquence est lue sur le CPU courant à chaque tick)
+worker_cpu = None
 results = []
 
 #-------------Topology--------------
@@ -37,62 +55,165 @@ def capture_system_topology():
 
 # ------------------ FUNCTION ------------------
 
-def run_perf(mode, size_mb, stride_val=None):
-
-    """Lance mem_stress.py avec perf et récupère les métriques"""
-    cmd = [
-        "perf", "stat",
-        "-e", "cycles,instructions,L1-dcache-load-misses,LLC-load-misses,dTLB-load-misses",
-        "-x", ";",
-        "python3", "mem_stress.py",
-        "--mode", mode,
-        "--size-mb", str(size_mb),
-        "--iters", str(iters),
-        "--duration", str(duration),
-        "--batch", str(batch)
-        #"--stride-bytes", str(stride)
-    ]
+def start_worker():
+    """Démarre mem_stress.py en mode worker (NumPy chargé une seule fois)"""
+    proc = subprocess.Popen(["python3", "mem_stress.py", "--mode", "worker"],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+    if worker_cpu is not None:
+        os.sched_setaffinity(proc.pid, {worker_cpu})
+    try:
+        hello = proc.stdout.readline()
+        if not hello or not json.loads(hello).get("ready"):
+            raise RuntimeError(f"mem_stress worker failed to start: {hello.strip() or 'no output'}")
+    except (RuntimeError, ValueError):
+        proc.kill()
+        proc.wait()
+        raise
+    return proc
+
+
+def stop_worker(proc):
+    if proc.poll() is None:
+        try:
+            proc.stdin.write(json.dumps({"mode": "quit"}) + "\n")
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+    proc.wait()
+
+
+def send_job(proc, job):
+    """Envoie un job JSON au worker et renvoie le résultat structuré"""
+    proc.stdin.write(json.dumps(job) + "\n")
+    proc.stdin.flush()
+    line = proc.stdout.readline()
+    if not line:
+        raise RuntimeError(f"worker died during job {job} (exit code {proc.wait()})")
+    reply = json.loads(line)
+    if not reply["ok"]:
+        raise RuntimeError(f"job {job} failed: {reply['error']}")
+    return reply["result"]
+
+
+def _perf_ctl(perf, command):
+    """Envoie enable/disable sur la fifo de contrôle de perf et attend son ack"""
+    os.write(perf["ctl_fd"], (command + "\n").encode())
+    deadline = time.monotonic() + perf_ack_timeout
+    while time.monotonic() < deadline:
+        if perf["proc"].poll() is not None:
+            return False
+        ready, _, _ = select.select([perf["ack_fd"]], [], [], 0.05)
+        if ready:
+            return b"ack" in os.read(perf["ack_fd"], 64)
+    return False
+
+
+def stop_perf(perf):
+    """Arrête perf (compteurs coupés au cas où le worker est mort avant) et renvoie sa sortie (stderr)"""
+    if perf["proc"].poll() is None:
+        _perf_ctl(perf, "disable")
+        perf["proc"].send_signal(signal.SIGINT)
+    _, stderr = perf["proc"].communicate()
+    os.close(perf["ctl_fd"])
+    os.close(perf["ack_fd"])
+    shutil.rmtree(perf["dir"], ignore_errors=True)
+    return stderr
+
+
+def start_perf(pid):
+    """
+    Attache perf stat au worker, compteurs désactivés (--delay=-1), et vérifie
+    par un aller-retour enable/disable sur --control que perf est prêt.
+    C'est ensuite le worker qui active les compteurs autour de la zone
+    chronométrée (fifos passées dans le job). Renvoie None (avec un message)
+    si perf est absent ou échoue.
+    """
+    ctl_dir = tempfile.mkdtemp(prefix="perf_ctl_")
+    ctl, ack = os.path.join(ctl_dir, "ctl"), os.path.join(ctl_dir, "ack")
+    os.mkfifo(ctl)
+    os.mkfifo(ack)
+    # O_RDWR : ouverture non bloquante d'une fifo sans lecteur/écrivain
+    perf = {"dir": ctl_dir, "ctl": ctl, "ack": ack,
+            "ctl_fd": os.open(ctl, os.O_RDWR), "ack_fd": os.open(ack, os.O_RDWR)}
+    cmd = ["perf", "stat", "-e", perf_events, "-x", ";",
+           "--delay=-1", f"--control=fifo:{ctl},{ack}", "-p", str(pid)]
+    try:
+        perf["proc"] = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        print("[WARN] perf not installed, counters will be empty")
+        os.close(perf["ctl_fd"])
+        os.close(perf["ack_fd"])
+        shutil.rmtree(ctl_dir, ignore_errors=True)
+        return None
+    if not (_perf_ctl(perf, "enable") and _perf_ctl(perf, "disable")):
+        if perf["proc"].poll() is None:
+            perf["proc"].kill()
+            perf["proc"].wait()
+        stderr = stop_perf(perf).strip()
+        print(f"[WARN] perf stat did not attach, counters will be empty: {stderr or 'no ack'}")
+        return None
+    return perf
 
+
+def run_perf(mode, size_mb, stride_val=None, access_pattern=None):
+
+    """Envoie le job au worker persistant sous perf stat -p et récupère les métriques"""
+    global worker
+    job = {"mode": mode, "size_mb": size_mb, "iters": iters, "duration": duration, "batch": batch,
+           "energy": measure_energy, "sysfs_root": sysfs_root}
     if stride_val is not None:
-        cmd.extend(["--stride-bytes", str(stride_val)])
-
-    print(f"Running benchmark: {mode}, size={size_mb}MiB | Stride: {stride_val if stride_val else 'N/A'}")
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-
-    stdout = proc.stdout
-    stderr = proc.stderr
-
-    # -------- Extraire débit / ops --------
-    ops = None
-    lat = None
-    for line in stdout.splitlines():
-        if "Copy" in line:
-            ops = float(line.split("=>")[1].split("GB/s")[0].strip())
-            if "latence" in line:
-                lat = float(line.split("latence:")[1].split("ns")[0].strip())
-        elif "sequential_read" in line:
-            ops = float(line.split("=>")[1].split("GB/s")[0].strip())
-            if "latence" in line:
-                lat = float(line.split("latence:")[1].split("ns")[0].strip())
-        elif "sequential_write" in line:
-            ops = float(line.split("=>")[1].split("GB/s")[0].strip())
-            if "latence" in line:
-                lat = float(line.split("latence:")[1].split("ns")[0].strip())
-        elif "Random" in line:
-            ops = float(line.split(":")[1].split(",")[0].strip())
-            if "latence" in line:
-                lat = float(line.split("latence:")[1].split("ns")[0].strip())
-        elif "Stride" in line: # Gère le nouveau mode stride
-            try: ops = float(line.split("ops/s:")[1].strip())
-            except: pass
+        job["stride_bytes"] = stride_val
+    if access_pattern is not None:
+        job["pattern"] = access_pattern
+
+    print(f"Running benchmark: {mode}, size={size_mb}MiB | Stride: {stride_val if stride_val else 'N/A'}"
+          f" | Pattern: {access_pattern if access_pattern else 'N/A'}")
+
+    # worker pas encore lancé, ou mort au job précédent (crash, OOM killer...) :
+    # on le (re)lance ; en cas d'échec le point vaut None et on réessaie au suivant
+    if worker is None or worker.poll() is not None:
+        if worker is not None:
+            print(f"[WARN] worker exited (code {worker.returncode}), restarting it")
+        try:
+            worker = start_worker()
+        except (RuntimeError, OSError, ValueError) as e:
+            print(f"[WARN] could not start worker, {mode} size={size_mb}MiB skipped: {e}")
+            worker = None
+
+    # perf s'attache au worker ; le worker ne l'active que pendant la zone chronométrée
+    perf = start_perf(worker.pid) if worker is not None else None
+    if perf is not None:
+        job["perf_ctl"] = perf["ctl"]
+        job["perf_ack"] = perf["ack"]
+
+    # un point en échec donne une ligne de None, le balayage continue
+    res = {}
+    stderr = ""
+    try:
+        if worker is not None:
+            res = send_job(worker, job)
+    except (RuntimeError, OSError, ValueError) as e:
+        print(f"[WARN] {mode} size={size_mb}MiB failed: {e}")
+    finally:
+        if perf is not None:
+            stderr = stop_perf(perf)
+
+    ops = res.get("ops_or_bw")
+    lat = res.get("lat_ns")
+    modeled_moved_gb_s = res.get("modeled_moved_gb_s")
+    useful_bytes = res.get("useful_bytes")
+    cache_lines = res.get("cache_lines")
+    dst_lines = res.get("dst_lines")
+    pages = res.get("pages")
 
     # -------- Extraire perf counters --------
+    # None = compteur non mesuré (perf absent, non attaché, <not supported>...)
     metrics = {
-        "cycles": 0,
-        "instructions": 0,
-        "L1_misses": 0,
-        "LLC_misses": 0,
-        "TLB_misses": 0,
+        "cycles": None,
+        "instructions": None,
+        "L1_misses": None,
+        "LLC_misses": None,
+        "TLB_misses": None,
         "size_mb": size_mb,  
         "stride": stride_val if stride_val else 0
     }
@@ -118,7 +239,15 @@ def run_perf(mode, size_mb, stride_val=None):
         elif counter == "dTLB-load-misses":
             metrics["TLB_misses"] = value
 
-    IPC = metrics["instructions"] / metrics["cycles"] if metrics["cycles"] > 0 else 0
+    if perf is not None and metrics["cycles"] is None:
+        print(f"[WARN] perf returned no counters: {stderr.strip()}")
+    if not res or res.get("perf_counted") is False:
+        # job en échec ou enable/disable non acquitté : zone comptée incomplète
+        if res:
+            print("[WARN] perf did not acknowledge the worker, counters discarded")
+        for k in ("cycles", "instructions", "L1_misses", "LLC_misses", "TLB_misses"):
+            metrics[k] = None
+    IPC = metrics["instructions"] / metrics["cycles"] if metrics["cycles"] and metrics["instructions"] is not None else None
 
     return {
         "pattern": mode,
@@ -130,6 +259,17 @@ def run_perf(mode, size_mb, stride_val=None):
         "L1_misses": metrics["L1_misses"],
         "LLC_misses": metrics["LLC_misses"],
         "TLB_misses": metrics["TLB_misses"],
+        "access_pattern": access_pattern,
+        "modeled_moved_gb_s": modeled_moved_gb_s,
+        "useful_bytes": useful_bytes,
+        "cache_lines": cache_lines,
+        "dst_lines": dst_lines,
+        "pages": pages,
+        "energy_pkg_j": res.get("energy_pkg_j"),
+        "energy_dram_j": res.get("energy_dram_j"),
+        "j_per_gb": res.get("j_per_gb"),
+        "j_per_access": res.get("j_per_access"),
+        "avg_freq_mhz": res.get("avg_freq_mhz"),
     }
 
 # ------------------ RUN BENCHMARK ------------------
@@ -138,19 +278,36 @@ def run_perf(mode, size_mb, stride_val=None):
 capture_system_topology()
 
 
-# 2.Memory patterns
+# 2.Worker persistant (un seul démarrage pour tout le balayage, lancé par
+# run_perf au premier point et relancé s'il meurt)
+worker = None
+
+# 3.Memory patterns
 print("=== PHASE 1: PATTERNS MEMOIRE ===")
 for size_mb in sizes_mb:
         for mode in patterns:
             results.append(run_perf(mode, size_mb))
 
 
-# 3. Boucle Stride (Impact du saut TLB)
+# 4. Boucle Stride (Impact du saut TLB)
 print("\n=== PHASE 2: IMPACT SAUT (STRIDE) ===")
 for s in stride_list:
     # we launch this mode with a fixed size_mb and different stride values
     results.append(run_perf("stride", fixed_size_for_stride, stride_val=s))
 
+
+# 5. Générateur de motifs (octets utiles vs déplacés)
+print("\n=== PHASE 3: MOTIFS D'ACCES (UTILE vs DEPLACE) ===")
+for p in access_patterns:
+    if p.startswith("stride"):
+        for s in pattern_strides:
+            results.append(run_perf("pattern", fixed_size_for_pattern, stride_val=s, access_pattern=p))
+    else:
+        results.append(run_perf("pattern", fixed_size_for_pattern, access_pattern=p))
+
+if worker is not None:
+    stop_worker(worker)
+
 # ------------------ SAVE RESULTS ------------------
 df = pd.DataFrame(results)
 df.to_csv("../results/memory_benchmark_results_full.csv", index=False)
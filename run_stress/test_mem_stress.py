@@ -0,0 +1,261 @@
+# test_mem_stress.py -- energy metering (fake sysfs tree), pattern accounting, worker
+import io
+import json
+
+import pytest
+
+import mem_stress
+
+
+def _write(path, value):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"{value}\n")
+
+
+def _zone(root, zone, name, energy_uj=None, max_range_uj=1_000_000_000):
+    d = root / "class" / "powercap" / zone
+    _write(d / "name", name)
+    _write(d / "max_energy_range_uj", max_range_uj)
+    if energy_uj is not None:
+        _write(d / "energy_uj", energy_uj)
+    return d
+
+
+@pytest.fixture
+def fake_sysfs(tmp_path, monkeypatch):
+    monkeypatch.setattr(mem_stress, "_ENERGY_ROOT", str(tmp_path))
+    # le benchmark "tourne" toujours sur cpu0 dans le faux arbre
+    monkeypatch.setattr(mem_stress, "_current_cpu", lambda: 0)
+    return tmp_path
+
+
+def test_energy_and_frequency(fake_sysfs):
+    pkg = _zone(fake_sysfs, "intel-rapl:0", "package-0", 100)
+    core = _zone(fake_sysfs, "intel-rapl:0:0", "core", 5)
+    dram = _zone(fake_sysfs, "intel-rapl:0:1", "dram", 999_999_000)
+    _write(fake_sysfs / "devices/system/cpu/cpu0/cpufreq/scaling_cur_freq", 2_400_000)
+
+    mem_stress._meter_start()
+    _write(pkg / "energy_uj", 2_000_100)    # +2 J
+    _write(core / "energy_uj", 9_000_005)   # ignoré (inclus dans package)
+    _write(dram / "energy_uj", 1_000_000)   # rebouclage : +1.001 J
+    mem_stress._meter_stop(bytes_moved=2 * 1024**3, accesses=1000)
+
+    e = mem_stress._LAST_ENERGY
+    assert e["energy_pkg_j"] == pytest.approx(2.0)
+    assert e["energy_dram_j"] == pytest.approx(1.001)
+    assert e["j_per_gb"] == pytest.approx(3.001 / 2)
+    assert e["j_per_access"] == pytest.approx(3.001 / 1000)
+    assert e["avg_freq_mhz"] == pytest.approx(2400)
+
+
+def test_missing_energy_uj(fake_sysfs):
+    pkg = _zone(fake_sysfs, "intel-rapl:0", "package-0", 0)
+    _zone(fake_sysfs, "intel-rapl:0:1", "dram")   # energy_uj illisible
+
+    mem_stress._meter_start()
+    _write(pkg / "energy_uj", 500_000)
+    mem_stress._meter_stop(bytes_moved=1024**3)
+
+    e = mem_stress._LAST_ENERGY
+    assert e["energy_pkg_j"] == pytest.approx(0.5)
+    assert e["energy_dram_j"] is None
+    assert e["j_per_gb"] == pytest.approx(0.5)
+    assert e["j_per_access"] is None
+
+
+def test_no_dram_no_cpufreq(fake_sysfs):
+    pkg = _zone(fake_sysfs, "intel-rapl:0", "package-0", 1_000)
+
+    mem_stress._meter_start()
+    _write(pkg / "energy_uj", 1_001_000)
+    mem_stress._meter_stop(bytes_moved=1024**3, accesses=10)
+
+    e = mem_stress._LAST_ENERGY
+    assert e["energy_pkg_j"] == pytest.approx(1.0)
+    assert e["energy_dram_j"] is None
+    assert e["j_per_access"] == pytest.approx(0.1)
+    assert e["avg_freq_mhz"] is None
+
+
+def test_no_rapl(fake_sysfs):
+    mem_stress._meter_start()
+    mem_stress._meter_stop(bytes_moved=1024**3, accesses=10)
+
+    e = mem_stress._LAST_ENERGY
+    assert e["energy_pkg_j"] is None
+    assert e["j_per_gb"] is None
+    assert e["j_per_access"] is None
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(mem_stress, "_ENERGY_ROOT", None)
+    mem_stress._meter_start()
+    mem_stress._meter_stop(bytes_moved=1024**3)
+    assert mem_stress._LAST_ENERGY is None
+
+
+# -------------------------------------------------------------------
+# Pattern generator accounting
+# -------------------------------------------------------------------
+@pytest.mark.parametrize("n, stride, unit, expected", [
+    (0, 8, 64, 0),
+    (1, 8, 64, 1),
+    (8, 8, 64, 1),        # 64 B contigus : une ligne
+    (9, 8, 64, 2),
+    (512, 16, 64, 128),   # stride < ligne : (511 * 16 + 8) octets couverts
+    (3, 64, 64, 3),       # stride >= unité : une unité par élément
+    (3, 8192, 4096, 3),
+    (1024, 8, 4096, 2),
+])
+def test_units_touched(n, stride, unit, expected):
+    assert mem_stress._units_touched(n, stride, unit) == expected
+
+
+def _plan(pattern, size, stride_bytes=4096, streams=4, row_bytes=4096, tile_bytes=512):
+    return mem_stress._pattern_plan(pattern, size, stride_bytes, streams, row_bytes, tile_bytes)
+
+
+@pytest.mark.parametrize("pattern", ["stride_fwd", "stride_bwd"])
+def test_plan_stride(pattern):
+    # 8 KiB, stride 64 B : 128 éléments, un par ligne, 2 pages
+    _, useful, lines, dst_lines, pages = _plan(pattern, 1024, stride_bytes=64)
+    assert (useful, lines, dst_lines, pages) == (128 * 8, 128, 0, 2)
+
+
+def test_plan_stride_backward_starts_from_the_end():
+    mem_stress._ARRAY_CACHE = {}
+    try:
+        arr = mem_stress._alloc("arr", 1024)
+        assert _plan("stride_fwd", 1024, stride_bytes=64)[0]() == pytest.approx(arr[::8].sum())
+        assert _plan("stride_bwd", 1024, stride_bytes=64)[0]() == pytest.approx(arr[::-8].sum())
+    finally:
+        mem_stress._ARRAY_CACHE = None
+
+
+def test_plan_stride_smaller_than_line():
+    # stride 16 B : 512 éléments, 4 par ligne -> 128 lignes
+    _, useful, lines, dst_lines, pages = _plan("stride_fwd", 1024, stride_bytes=16)
+    assert (useful, lines, dst_lines, pages) == (512 * 8, 128, 0, 2)
+
+
+def test_plan_multi_stream():
+    # 4 flux de 4 KiB par bloc sur 64 KiB : 2 blocs par flux
+    kernel, useful, lines, dst_lines, pages = _plan("multi_stream", 8192, streams=4, row_bytes=4096)
+    assert (useful, lines, dst_lines, pages) == (65536, 1024, 1024, 16)
+
+
+def test_plan_multi_stream_block_larger_than_stream():
+    # size // k < blk : le bloc est réduit à la longueur d'un flux
+    kernel, useful, lines, dst_lines, pages = _plan("multi_stream", 1024, streams=4, row_bytes=4096)
+    assert (useful, lines, dst_lines, pages) == (8192, 128, 128, 2)
+    kernel()
+
+
+def test_plan_2d_accounting():
+    # 64 x 64 éléments (lignes de 512 B), tuiles 8 x 8
+    row = _plan("row_major", 4096, row_bytes=512)
+    col = _plan("col_major", 4096, row_bytes=512)
+    tiled = _plan("tiled", 4096, row_bytes=512, tile_bytes=64)
+    assert row[1:] == (32768, 512, 512, 8)
+    assert col[1:] == (32768, 64 * 64, 512, 8)   # une ligne par élément
+    assert tiled[1:] == (32768, 512, 512, 8)
+
+
+def test_plan_2d_kernels_traversal_order():
+    mem_stress._ARRAY_CACHE = {}
+    try:
+        src = mem_stress._alloc("arr", 4096).reshape(64, 64)
+        dst = mem_stress._alloc("dst", 4096, "empty")
+        _plan("col_major", 4096, row_bytes=512)[0]()
+        assert (dst.reshape(64, 64) == src.T).all()
+        _plan("tiled", 4096, row_bytes=512, tile_bytes=64)[0]()
+        assert (dst.reshape(8, 8, 8, 8) == src.reshape(8, 8, 8, 8).transpose(0, 2, 1, 3)).all()
+    finally:
+        mem_stress._ARRAY_CACHE = None
+
+
+def test_plan_tiled_not_dividing_row():
+    # tuile de 8 éléments pour des lignes de 12
+    with pytest.raises(ValueError, match="tile of 8 elements"):
+        _plan("tiled", 1200, row_bytes=96, tile_bytes=64)
+
+
+def test_plan_tiled_clipped_by_rows_reports_real_tile():
+    # 3 lignes seulement : tuile réduite à 3, qui ne divise pas 8
+    with pytest.raises(ValueError, match="tile of 3 elements"):
+        _plan("tiled", 24, row_bytes=64, tile_bytes=64)
+
+
+def test_plan_unknown_pattern():
+    with pytest.raises(ValueError, match="unknown pattern"):
+        _plan("zigzag", 1024)
+
+
+# -------------------------------------------------------------------
+# Persistent worker
+# -------------------------------------------------------------------
+def test_worker_loop(monkeypatch):
+    monkeypatch.setattr(mem_stress, "_ARRAY_CACHE", None)
+    ones_calls = []
+    real_ones = mem_stress.np.ones
+    monkeypatch.setattr(mem_stress.np, "ones", lambda n: ones_calls.append(n) or real_ones(n))
+
+    jobs = [
+        {"mode": "sequential_read", "size_mb": 1, "iters": 2},
+        {"mode": "bogus"},
+        {"mode": "sequential_write", "size_mb": 1, "iters": 1, "latencies": True},
+        {"mode": "quit"},
+        {"mode": "sequential_read", "size_mb": 1, "iters": 1},   # jamais exécuté
+    ]
+    inp = io.StringIO("".join(json.dumps(j) + "\n" for j in jobs))
+    out = io.StringIO()
+    mem_stress.worker_loop(inp, out)
+
+    replies = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert replies[0] == {"ready": True}
+    assert len(replies) == 4   # ready + 3 réponses, rien après quit
+
+    assert replies[1]["ok"]
+    r = replies[1]["result"]
+    assert r["mode"] == "sequential_read" and r["ops_or_bw"] > 0 and "latencies" not in r
+
+    assert not replies[2]["ok"]
+    assert "unknown mode: bogus" in replies[2]["error"]
+
+    assert replies[3]["ok"]
+    assert len(replies[3]["result"]["latencies"]) == 1
+
+    # sequential_read et sequential_write partagent le tableau "ones" de 1 MiB
+    assert ones_calls == [1024 * 1024 // 8]
+
+
+def test_wrap_without_max_range_is_unknown(fake_sysfs):
+    pkg = _zone(fake_sysfs, "intel-rapl:0", "package-0", 500)
+    (pkg / "max_energy_range_uj").unlink()
+    dram = _zone(fake_sysfs, "intel-rapl:0:1", "dram", 0)
+
+    mem_stress._meter_start()
+    _write(pkg / "energy_uj", 100)          # rebouclage sans plage connue
+    _write(dram / "energy_uj", 250_000)
+    mem_stress._meter_stop(bytes_moved=1024**3)
+
+    e = mem_stress._LAST_ENERGY
+    assert e["energy_pkg_j"] is None
+    assert e["energy_dram_j"] == pytest.approx(0.25)
+
+
+def test_failed_kernel_does_not_leak_sampler(fake_sysfs, monkeypatch):
+    _zone(fake_sysfs, "intel-rapl:0", "package-0", 0)
+    samplers = []
+
+    def boom(size_mb, iterations):
+        mem_stress._meter_start()
+        samplers.append(mem_stress._meter["thread"])
+        raise RuntimeError("kernel failed")
+    monkeypatch.setattr(mem_stress, "copy_test", boom)
+
+    with pytest.raises(RuntimeError):
+        mem_stress.run_job({"mode": "copy", "energy": True, "sysfs_root": str(fake_sysfs)})
+    assert mem_stress._meter is None
+    assert not samplers[0].is_alive()